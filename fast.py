@@ -0,0 +1,68 @@
+"""Pure per-request helpers, kept free of app state so they can be compiled with mypyc.
+
+The Docker build runs `mypyc fast.py`; without that step this module is imported as plain Python.
+"""
+from typing import Any, Dict, Final, Optional, Tuple, TypedDict
+
+# Response shapes are plain dicts: yt_dlp data is trusted and only needs serializing
+class FormatInfo(TypedDict):
+    format_id: str
+    ext: str
+    resolution: str
+    note: str
+    type: str
+    filesize: Optional[int]
+    height: int
+
+# Characters not allowed in filenames, stripped in a single C-level pass
+_SANITIZE_TABLE: Final = str.maketrans('', '', '<>:"/\\|?*')
+
+# (has_video, has_audio) -> format type; formats with neither are skipped
+_TYPE_LABELS: Final[Dict[Tuple[bool, bool], str]] = {
+    (True, False): 'video',
+    (False, True): 'audio',
+    (True, True): 'combined',
+}
+
+def sanitize_filename(name: str) -> str:
+    """Remove invalid characters from filename"""
+    return name.translate(_SANITIZE_TABLE)[:200]
+
+def build_format(f: Dict[str, Any]) -> Optional[FormatInfo]:
+    """Build a FormatInfo from a raw yt_dlp format, or None if it has no streams"""
+    vcodec = f.get('vcodec')
+    acodec = f.get('acodec')
+    type_label = _TYPE_LABELS.get((bool(vcodec and vcodec != 'none'), bool(acodec and acodec != 'none')))
+    if type_label is None:
+        return None
+
+    height = f.get('height') or 0
+    note = f.get('format_note') or ''
+    tbr = f.get('tbr')
+    if tbr:
+        note = f"{note} ({tbr:.0f}kbps)" if note else f"{tbr:.0f}kbps"
+
+    return FormatInfo(
+        format_id=f['format_id'],
+        ext=f.get('ext', ''),
+        resolution=f.get('resolution') or f"{f.get('width','?')}x{height}",
+        note=note,
+        type=type_label,
+        filesize=f.get('filesize'),
+        height=height,
+    )
+
+# mypyc checks declared types at runtime, so values coming out of yt_dlp's info dict
+# stay Any until they're explicitly converted (extractors may report float sizes, tuples...)
+
+def _thumbnail_area(t: Dict[str, Any]) -> float:
+    return float((t.get('width') or 0) * (t.get('height') or 0))
+
+def extract_thumbnail(info: Dict[str, Any]) -> str:
+    """Return the thumbnail URL, falling back to the largest listed thumbnail"""
+    thumbnail = info.get('thumbnail')
+    if thumbnail:
+        return str(thumbnail)
+    # Pick by area (list order varies by extractor); on ties keep the last one, which is yt_dlp's preferred
+    thumbnails = list(info.get('thumbnails') or [{}])
+    return str(max(reversed(thumbnails), key=_thumbnail_area).get('url') or '')
@@ -1,18 +1,35 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, JSONResponse
+from pydantic import BaseModel, Field
+from diskcache import Cache
 import yt_dlp
-from typing import Optional, List
+from fast import FormatInfo, sanitize_filename, build_format, extract_thumbnail
+from typing import Optional, List, Tuple, TypedDict
+import orjson
 import os
+import sys
 import tempfile
-import subprocess
+import threading
+import time
 import uuid
 import asyncio
+import anyio
+import functools
+import contextlib
+import copy
+import heapq
+import itertools
+from collections import OrderedDict
 from pathlib import Path
-import re
+from urllib.parse import quote
 
-app = FastAPI(title="AnyStreamPro API", version="2.0.0")
+class ORJSONResponse(JSONResponse):
+    # orjson serializes plain dicts in C, no per-field validation on the way out
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+app = FastAPI(title="AnyStreamPro API", version="2.0.0", default_response_class=ORJSONResponse)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -27,9 +44,36 @@ app.add_middleware(
 TEMP_DIR = Path(tempfile.gettempdir()) / "anystreampro"
 TEMP_DIR.mkdir(exist_ok=True)
 
+# Read size when relaying ffmpeg output to the client
+CHUNK_SIZE = 1024 * 1024
+
+# Cookie file handed to yt_dlp, resolved once at startup
+_COOKIE_FILE = None
+
+# Background task that sweeps stale temp files
+_cleanup_task = None
+
+# ffmpeg availability, probed once on the first /health hit
+_ffmpeg_status = None
+
+# YoutubeDL instances reused across extractions so HTTP connections and the
+# player JS cache carry over. Extraction runs in asyncio.to_thread workers and
+# YoutubeDL isn't thread-safe, so each worker thread keeps its own.
+_ydl_local = threading.local()
+
+# Short-lived metadata cache so /api/download can reuse what /api/formats extracted
+cache = Cache(str(TEMP_DIR / "meta"))
+
+# In-process LRU of built /api/formats responses: key -> (expiry, response).
+# Only touched from the event loop thread, so no locking needed.
+FORMATS_CACHE_TTL = 60
+FORMATS_CACHE_SIZE = 512
+_formats_cache = OrderedDict()
+
 class URLRequest(BaseModel):
     url: str
     proxy: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1)  # only return the N highest resolutions
 
 class DownloadRequest(BaseModel):
     url: str
@@ -37,35 +81,160 @@ class DownloadRequest(BaseModel):
     audio_format: str
     proxy: Optional[str] = None
 
-class FormatInfo(BaseModel):
-    format_id: str
-    ext: str
-    resolution: str
-    note: str
-    type: str
-    filesize: Optional[int]
-    height: int
-
-class FormatsResponse(BaseModel):
+class FormatsResponse(TypedDict):
     status: str
     title: str
     thumbnail: str
     formats: List[FormatInfo]
 
-def sanitize_filename(name: str) -> str:
-    """Remove invalid characters from filename"""
-    return re.sub(r'[<>:"/\\|?*]', '', name)[:200]
+def _new_ydl(opts: dict) -> yt_dlp.YoutubeDL:
+    """Create a YoutubeDL that reads the cookie file but never writes it back"""
+    ydl = yt_dlp.YoutubeDL(opts)
+    ydl.cookiejar  # load the jar from the cookie file now
+    # close() would otherwise rewrite the shared cookie file in place, which isn't atomic
+    ydl.params['cookiefile'] = None
+    return ydl
+
+def _get_ydl(proxy: Optional[str], cookie_file: Optional[str]) -> yt_dlp.YoutubeDL:
+    """Return this thread's reusable YoutubeDL for the given proxy/cookies"""
+    pool = getattr(_ydl_local, 'pool', None)
+    if pool is None:
+        pool = _ydl_local.pool = {}
+
+    key = (proxy, cookie_file)
+    ydl = pool.get(key)
+    if ydl is None:
+        if len(pool) >= 8:
+            # Proxies come from clients, don't keep an instance around for every one
+            for old in pool.values():
+                old.close()
+            pool.clear()
+
+        # Use default robust options instead of forcing clients
+        ydl_opts = {
+            'quiet': False,
+            'no_warnings': False,
+            'skip_download': True,
+            'proxy': proxy if proxy else None,
+            'cookiefile': cookie_file,
+            'logtostderr': True,
+            'cachedir': str(TEMP_DIR / "ytdlp_cache"),
+            # 'format': 'best', # Un-commenting this sometimes helps, but default is usually fine for metadata
+        }
+        ydl = pool[key] = _new_ydl(ydl_opts)
+    return ydl
+
+@cache.memoize(expire=600)
+def _extract(url: str, proxy: Optional[str], cookie_file: Optional[str]) -> dict:
+    """Extract the full info dict for a URL (cached for 10 minutes)"""
+    ydl = _get_ydl(proxy, cookie_file)
+    print(f"DEBUG: Extracting info for {url}")
+    info = ydl.extract_info(url, download=False)
+    # Strip private/unpicklable keys, same as --load-info-json expects
+    return ydl.sanitize_info(info, remove_private_keys=True)
+
+# Protocols ffmpeg can read itself from a single URL
+_FFMPEG_PROTOCOLS = {'http', 'https', 'm3u8', 'm3u8_native'}
+
+def _ffmpeg_can_fetch(fmt: dict) -> bool:
+    # Fragment-based formats (DASH segments, ISM, F4M...) need yt_dlp's downloader, and so do
+    # https formats yt_dlp fetches in ranged chunks (YouTube throttles single full-length requests)
+    return (fmt.get('protocol') in _FFMPEG_PROTOCOLS and bool(fmt.get('url'))
+            and not (fmt.get('downloader_options') or {}).get('http_chunk_size'))
+
+def _ffmpeg_inputs(opts: dict, info: dict, job_id: str) -> Tuple[List[str], str, List[Tuple[str, Path]]]:
+    """Resolve the selected formats to ffmpeg input args and the audio codec.
+
+    Formats ffmpeg can't fetch itself are returned as (format_id, path) pairs; they
+    must be downloaded to that path with yt_dlp before ffmpeg starts.
+    """
+    with _new_ydl(opts) as ydl:
+        selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+        streams = selected.get('requested_formats') or [selected]
+        args, downloads = [], []
+        for i, fmt in enumerate(streams):
+            if not _ffmpeg_can_fetch(fmt):
+                path = TEMP_DIR / f"{job_id}_{i}.{fmt.get('ext') or 'bin'}"
+                downloads.append((fmt['format_id'], path))
+                args += ['-i', str(path)]
+                continue
+
+            headers = dict(fmt.get('http_headers') or {})
+            cookie = ydl.cookiejar.get_cookie_header(fmt['url'])
+            if cookie:
+                headers['Cookie'] = cookie
+            if headers:
+                args += ['-headers', ''.join(f'{k}: {v}\r\n' for k, v in headers.items())]
+            args += ['-i', fmt['url']]
+        # Audio is the last stream of a "<video>+<audio>" selection
+        return args, streams[-1].get('acodec') or '', downloads
+
+def _dl(opts: dict, info: dict):
+    """Download one format from an already extracted info dict with yt_dlp's downloader"""
+    with _new_ydl(opts) as ydl:
+        ydl.process_ie_result(copy.deepcopy(info), download=True)
+
+def _get_cached_formats(key: tuple) -> Optional[FormatsResponse]:
+    """Return a still-fresh /api/formats response, evicting it if expired"""
+    entry = _formats_cache.get(key)
+    if entry is None:
+        return None
+    expiry, value = entry
+    if expiry < time.monotonic():
+        del _formats_cache[key]
+        return None
+    _formats_cache.move_to_end(key)
+    return value
+
+def _store_cached_formats(key: tuple, value: FormatsResponse):
+    _formats_cache[key] = (time.monotonic() + FORMATS_CACHE_TTL, value)
+    _formats_cache.move_to_end(key)
+    if len(_formats_cache) > FORMATS_CACHE_SIZE:
+        _formats_cache.popitem(last=False)
 
 def cleanup_old_files():
     """Remove files older than 1 hour"""
-    import time
     now = time.time()
-    for f in TEMP_DIR.glob("*"):
-        if f.is_file() and (now - f.stat().st_mtime) > 3600:
-            try:
-                f.unlink()
-            except:
-                pass
+    # scandir yields entries with the file type already known, no per-file is_file() stat
+    with os.scandir(TEMP_DIR) as entries:
+        for entry in entries:
+            if entry.path == _COOKIE_FILE or not entry.is_file():
+                continue
+            # Another sweep (or worker) may have removed it already
+            with contextlib.suppress(OSError):
+                if (now - entry.stat().st_mtime) > 3600:
+                    os.unlink(entry.path)
+
+async def _cleanup_loop():
+    """Sweep TEMP_DIR every 10 minutes, off the request path"""
+    while True:
+        await asyncio.sleep(600)
+        # A failed sweep (e.g. TEMP_DIR removed by a tmp reaper) must not end the loop
+        try:
+            await asyncio.to_thread(cleanup_old_files)
+        except Exception as e:
+            print(f"DEBUG: Temp cleanup failed: {e}")
+
+@app.on_event("startup")
+def init_cookies():
+    """Write env cookies to disk once, instead of on every request"""
+    global _COOKIE_FILE
+    if os.environ.get('COOKIES_CONTENT'):
+        cookie_path = TEMP_DIR / "cookies.txt"
+        # Write to a temp file and rename into place so readers never see a partial file
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=TEMP_DIR, delete=False) as f:
+            f.write(os.environ['COOKIES_CONTENT'])
+        os.replace(f.name, cookie_path)
+        _COOKIE_FILE = str(cookie_path)
+    elif os.path.exists("cookies.txt"):
+        print("DEBUG: Found local cookies.txt file")
+        _COOKIE_FILE = "cookies.txt"
+
+@app.on_event("startup")
+async def start_cleanup_loop():
+    global _cleanup_task
+    # Keep a reference so the task isn't garbage collected
+    _cleanup_task = asyncio.create_task(_cleanup_loop())
 
 @app.get("/")
 async def root():
@@ -73,230 +242,216 @@ async def root():
 
 @app.get("/health")
 async def health():
-    # Check if ffmpeg is available
-    try:
-        subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
-        ffmpeg_status = "available"
-    except:
-        ffmpeg_status = "not found"
-    return {"status": "healthy", "ffmpeg": ffmpeg_status}
+    global _ffmpeg_status
+    # Check if ffmpeg is available (it can't change at runtime, so only probe once)
+    if _ffmpeg_status is None:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-version",
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            await proc.wait()
+            _ffmpeg_status = "available" if proc.returncode == 0 else "not found"
+        except OSError:
+            _ffmpeg_status = "not found"
+    return {"status": "healthy", "ffmpeg": _ffmpeg_status}
 
-@app.post("/api/formats", response_model=FormatsResponse)
+@app.post("/api/formats")
 async def get_formats(request: URLRequest):
     """Extract available formats from a video URL"""
-    cleanup_old_files()
-
     print(f"DEBUG: Processing URL: {request.url}")
 
-    # Handle cookies from env
-    cookie_file = None
-    if os.environ.get('COOKIES_CONTENT'):
-        cookie_path = TEMP_DIR / "cookies.txt"
-        with open(cookie_path, "w", encoding="utf-8") as f:
-            f.write(os.environ['COOKIES_CONTENT'])
-        cookie_file = str(cookie_path)
-    elif os.path.exists("cookies.txt"):
-        print("DEBUG: Found local cookies.txt file")
-        cookie_file = "cookies.txt"
-
-    # Use default robust options instead of forcing clients
-    ydl_opts = {
-        'quiet': False,
-        'no_warnings': False,
-        'skip_download': True,
-        'proxy': request.proxy if request.proxy else None,
-        'cookiefile': cookie_file,
-        'logtostderr': True,
-        # 'format': 'best', # Un-commenting this sometimes helps, but default is usually fine for metadata
-    }
+    cache_key = (request.url, request.proxy, request.limit)
+    cached = _get_cached_formats(cache_key)
+    if cached is not None:
+        print(f"DEBUG: Serving cached formats for {request.url}")
+        return ORJSONResponse(cached)
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            print(f"DEBUG: Extracting info for {request.url}")
-            info = ydl.extract_info(request.url, download=False)
-
-            title = info.get('title', 'Unknown Title')
-            thumbnail = info.get('thumbnail')
-            if not thumbnail and info.get('thumbnails'):
-                thumbnails = info.get('thumbnails', [])
-                if thumbnails:
-                    # Get highest resolution thumbnail
-                    thumbnail = thumbnails[-1].get('url')
-
-            formats = []
-            raw_formats = info.get('formats', [])
-
-            if not raw_formats:
-                # Some sites (like instagram) might not return 'formats' but just a direct url
-                if info.get('url'):
-                    # Create a synthetic format
-                    formats.append(FormatInfo(
-                        format_id='default',
-                        ext=info.get('ext', 'mp4'),
-                        resolution=f"{info.get('width', '?')}x{info.get('height', '?')}",
-                        note='Default Source',
-                        type='combined',
-                        filesize=info.get('filesize'),
-                        height=info.get('height', 0),
-                    ))
-
-            for f in raw_formats:
-                vcodec = f.get('vcodec')
-                acodec = f.get('acodec')
-                height = f.get('height') or 0
-
-                has_video = vcodec and vcodec != 'none'
-                has_audio = acodec and acodec != 'none'
-
-                if has_video and not has_audio:
-                    type_label = "video"
-                elif has_audio and not has_video:
-                    type_label = "audio"
-                elif has_video and has_audio:
-                    type_label = "combined"
-                else:
-                    continue
-
-                bitrate = f.get('tbr')
-                note = f.get('format_note', '')
-                if bitrate:
-                    note = f"{note} ({int(bitrate)}kbps)".strip()
+        info = await asyncio.to_thread(_extract, request.url, request.proxy, _COOKIE_FILE)
 
+        title = info.get('title', 'Unknown Title')
+        thumbnail = extract_thumbnail(info)
+
+        formats = []
+        raw_formats = info.get('formats', [])
+
+        if not raw_formats:
+            # Some sites (like instagram) might not return 'formats' but just a direct url
+            if info.get('url'):
+                # Create a synthetic format
                 formats.append(FormatInfo(
-                    format_id=f['format_id'],
-                    ext=f.get('ext', ''),
-                    resolution=f.get('resolution') or f"{f.get('width','?')}x{height}",
-                    note=note,
-                    type=type_label,
-                    filesize=f.get('filesize'),
-                    height=height,
+                    format_id='default',
+                    ext=info.get('ext', 'mp4'),
+                    resolution=f"{info.get('width', '?')}x{info.get('height', '?')}",
+                    note='Default Source',
+                    type='combined',
+                    filesize=info.get('filesize'),
+                    height=info.get('height', 0),
                 ))
 
-            formats.sort(key=lambda x: x.height, reverse=True)
-
-            print(f"DEBUG: Successfully found {len(formats)} formats")
-            return FormatsResponse(
-                status="success",
-                title=title,
-                thumbnail=thumbnail or '',
-                formats=formats
-            )
+        # Formats with no streams are dropped inside the generator, before any sorting
+        built = filter(None, map(build_format, raw_formats))
+        if request.limit is not None:
+            # Heap top-N instead of sorting everything when the client wants only a few
+            formats = heapq.nlargest(request.limit, itertools.chain(formats, built), key=lambda x: x['height'])
+        else:
+            formats.extend(built)
+            formats.sort(key=lambda x: x['height'], reverse=True)
+
+        print(f"DEBUG: Successfully found {len(formats)} formats")
+        response = FormatsResponse(
+            status="success",
+            title=title,
+            thumbnail=thumbnail,
+            formats=formats
+        )
+        _store_cached_formats(cache_key, response)
+        # Returned as a Response so FastAPI skips its jsonable_encoder pass
+        return ORJSONResponse(response)
 
     except Exception as e:
         error_msg = str(e)
         print(f"DEBUG: Extraction failed: {error_msg}")
         raise HTTPException(status_code=400, detail=f"Extraction failed: {error_msg}")
 
+def _remove_job_files(job_id: str):
+    """Delete everything a download job left in TEMP_DIR, including yt_dlp .part/.ytdl files"""
+    for path in TEMP_DIR.glob(f"{job_id}_*"):
+        path.unlink(missing_ok=True)
+
+async def _finish_job(job_id: str, proc, stderr_task):
+    """Stop ffmpeg, delete the job's temp files, then reap the process"""
+    # Synchronous teardown first so it happens even if the awaits below get cancelled
+    if proc is not None and proc.returncode is None:
+        proc.kill()
+    _remove_job_files(job_id)
+
+    with anyio.CancelScope(shield=True):
+        if proc is not None:
+            await proc.wait()
+        if stderr_task is not None:
+            stderr = await stderr_task
+            if proc.returncode > 0:
+                print(f"DEBUG: FFmpeg failed: {stderr.decode()}")
+
+class JobStreamingResponse(StreamingResponse):
+    # Runs the cleanup however the response ends: finished, client disconnect, or
+    # a body generator that never got started. A generator's own finally can't cover
+    # the last two, and its awaits get cancelled along with the stream.
+    def __init__(self, content, cleanup, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.cleanup()
+
 @app.post("/api/download")
 async def download_merged(request: DownloadRequest):
     """Download and merge video+audio, then stream to user"""
 
     job_id = str(uuid.uuid4())[:8]
-    video_file = TEMP_DIR / f"{job_id}_video.mp4"
-    audio_file = TEMP_DIR / f"{job_id}_audio.m4a"
-    output_file = TEMP_DIR / f"{job_id}_merged.mp4"
-
-    # Handle cookies from env
-    cookie_file = None
-    if os.environ.get('COOKIES_CONTENT'):
-        cookie_path = TEMP_DIR / "cookies.txt"
-        with open(cookie_path, "w", encoding="utf-8") as f:
-            f.write(os.environ['COOKIES_CONTENT'])
-        cookie_file = str(cookie_path)
-
+    proc = None
+    stderr_task = None
     try:
-        # Get video info first for title
-        ydl_opts_info = {
-            'quiet': True,
-            'no_warnings': True,
-            'skip_download': True,
-            'proxy': request.proxy if request.proxy else None,
-            'cookiefile': cookie_file,
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts_info) as ydl:
-            info = ydl.extract_info(request.url, download=False)
-            title = sanitize_filename(info.get('title', 'video'))
+        # Reuse the info /api/formats already extracted (or extract it once now)
+        info = await asyncio.to_thread(_extract, request.url, request.proxy, _COOKIE_FILE)
+        title = sanitize_filename(str(info.get('title', 'video')))
 
-        # Download video stream
-        ydl_opts_video = {
-            'format': request.video_format,
+        # Let yt_dlp pick the streams, then have ffmpeg pull both and mux in one pass
+        ydl_opts = {
+            'format': f"{request.video_format}+{request.audio_format}",
             'quiet': True,
             'no_warnings': True,
-            'outtmpl': str(video_file),
             'proxy': request.proxy if request.proxy else None,
-            'cookiefile': cookie_file,
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts_video) as ydl:
-            ydl.download([request.url])
-
-        # Download audio stream
-        ydl_opts_audio = {
-            'format': request.audio_format,
-            'quiet': True,
-            'no_warnings': True,
-            'outtmpl': str(audio_file),
-            'proxy': request.proxy if request.proxy else None,
-            'cookiefile': cookie_file,
+            'cookiefile': _COOKIE_FILE,
         }
-
-        with yt_dlp.YoutubeDL(ydl_opts_audio) as ydl:
-            ydl.download([request.url])
-
-        # Merge with ffmpeg
+        inputs, acodec, downloads = await asyncio.to_thread(_ffmpeg_inputs, ydl_opts, info, job_id)
+
+        # Streams ffmpeg can't fetch directly are downloaded by yt_dlp first, in parallel.
+        # Let every download finish (or fail) before cleaning up, so no thread is still
+        # writing a file after its path has been removed.
+        results = await asyncio.gather(*(
+            asyncio.to_thread(_dl, {**ydl_opts, 'format': format_id, 'outtmpl': str(path)}, info)
+            for format_id, path in downloads
+        ), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        # Remux both streams as-is; only re-encode audio that MP4 players can't take as AAC
+        audio_codec = 'copy' if acodec.startswith(('mp4a', 'aac')) else 'aac'
         ffmpeg_cmd = [
-            'ffmpeg', '-y',
-            '-i', str(video_file),
-            '-i', str(audio_file),
+            'ffmpeg', '-loglevel', 'error',
+            *inputs,
             '-c:v', 'copy',
-            '-c:a', 'aac',
-            '-strict', 'experimental',
-            str(output_file)
+            '-c:a', audio_codec,
+            # Fragmented MP4 can be written to a pipe as it's produced
+            '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+            '-f', 'mp4',
+            'pipe:1'
         ]
 
-        process = subprocess.run(ffmpeg_cmd, capture_output=True)
-        if process.returncode != 0:
-            raise Exception(f"FFmpeg failed: {process.stderr.decode()}")
-
-        # Cleanup temp files
-        if video_file.exists():
-            video_file.unlink()
-        if audio_file.exists():
-            audio_file.unlink()
-
-        # Return file with proper name
+        # ffmpeg picks up HTTP(S) proxies from the environment
+        env = None
+        if request.proxy:
+            env = {**os.environ, 'http_proxy': request.proxy, 'HTTP_PROXY': request.proxy}
+
+        proc = await asyncio.create_subprocess_exec(
+            *ffmpeg_cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            limit=CHUNK_SIZE,
+        )
+        # Drain stderr alongside stdout so ffmpeg never blocks on a full pipe
+        stderr_task = asyncio.create_task(proc.stderr.read())
+
+        # Wait for the first bytes so startup failures still surface as a 500
+        first_chunk = await proc.stdout.read(CHUNK_SIZE)
+        if not first_chunk:
+            await proc.wait()
+            stderr = await stderr_task
+            raise Exception(f"FFmpeg failed: {stderr.decode()}")
+
+        async def stream():
+            yield first_chunk
+            while chunk := await proc.stdout.read(CHUNK_SIZE):
+                yield chunk
+            await proc.wait()
+
+        # Return stream with proper name
         filename = f"{title}.mp4"
-
-        def file_iterator():
-            with open(output_file, 'rb') as f:
-                while chunk := f.read(1024 * 1024):  # 1MB chunks
-                    yield chunk
-            # Cleanup after sending
-            try:
-                output_file.unlink()
-            except:
-                pass
-
-        return StreamingResponse(
-            file_iterator(),
+        quoted = quote(filename)
+        if quoted != filename:
+            disposition = f"attachment; filename*=utf-8''{quoted}"
+        else:
+            disposition = f'attachment; filename="{filename}"'
+
+        return JobStreamingResponse(
+            stream(),
+            cleanup=functools.partial(_finish_job, job_id, proc, stderr_task),
             media_type='video/mp4',
-            headers={
-                'Content-Disposition': f'attachment; filename="{filename}"',
-                'Content-Type': 'video/mp4',
-            }
+            headers={'Content-Disposition': disposition},
         )
 
     except Exception as e:
-        # Cleanup on error
-        for f in [video_file, audio_file, output_file]:
-            if f.exists():
-                try:
-                    f.unlink()
-                except:
-                    pass
+        # Don't leave ffmpeg running if we fail before streaming starts
+        await _finish_job(job_id, proc, stderr_task)
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        # uvloop has no Windows build
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+    )